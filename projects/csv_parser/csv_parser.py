@@ -1,43 +1,109 @@
-from enum import Enum
-from typing import Iterator, Iterable
+from enum import IntEnum
+from typing import Callable, Iterator, Iterable
 
 # ============================================================
 # Level 1: CSV Parser State Machine
 # ============================================================
 
-class States(Enum):
-    START = "START"
-    QUOTE = "QUOTE"
-    UNQUOTE = "UNQUOTE"
-    QUOTE_IN_QUOTE = "QUOTE_IN_QUOTE"
+# Plain int states, so they can be baked into generated code as literals
+START, QUOTE, UNQUOTE, QUOTE_IN_QUOTE = 0, 1, 2, 3
+
+
+class States(IntEnum):
+    """ Named view of the int states, kept for readability and compatibility. """
+    START = START
+    QUOTE = QUOTE
+    UNQUOTE = UNQUOTE
+    QUOTE_IN_QUOTE = QUOTE_IN_QUOTE
 
 
 class CSVParser:
+    __slots__ = ('delimiter', 'quote', 'state_transition', '_scan')
+
     def __init__(self, delimiter=',', quote='"'):
+        if len(delimiter) != 1 or len(quote) != 1 or delimiter == quote:
+            raise ValueError("delimiter and quote must be distinct single characters")
         self.delimiter = delimiter
         self.quote = quote
         self.state_transition = {
-            States.START: {
-                delimiter: States.START,
-                quote: States.QUOTE,
-                "OTHERS": States.UNQUOTE
+            START: {
+                delimiter: START,
+                quote: QUOTE,
+                "OTHERS": UNQUOTE
             },
-            States.UNQUOTE: {
-                delimiter: States.START,
-                "OTHERS": States.UNQUOTE
+            UNQUOTE: {
+                delimiter: START,
+                "OTHERS": UNQUOTE
 
             },
-            States.QUOTE: {
-                quote: States.QUOTE_IN_QUOTE,
-                "OTHERS": States.QUOTE
+            QUOTE: {
+                quote: QUOTE_IN_QUOTE,
+                "OTHERS": QUOTE
             },
 
-            States.QUOTE_IN_QUOTE: {
-                delimiter: States.START,
-                quote: States.QUOTE, # escape
-                "OTHERS": States.QUOTE_IN_QUOTE
+            QUOTE_IN_QUOTE: {
+                delimiter: START,
+                quote: QUOTE, # escape
+                "OTHERS": QUOTE_IN_QUOTE
             }
         }
+        self._scan = self._compile_scan()
+
+    def _compile_scan(self) -> Callable[[str], list[str]]:
+        """ Generate a scanner specialized to this delimiter and quote.
+
+        Every transition in state_transition becomes a branch on literal
+        character and state values, so the per-character loop does no dict,
+        table or attribute lookups. Kept characters cost nothing: a field is
+        sliced out of the row in runs, cut only where a delimiter or a
+        structural quote is dropped.
+        """
+        src = [
+            "def _scan(row):",
+            "    state = %d" % START,
+            "    cells = []",
+            "    cell = ''",
+            "    seg = 0",
+            "    for i, c in enumerate(row):",
+        ]
+        for test, char in (("if c == %r:" % self.delimiter, self.delimiter),
+                           ("elif c == %r:" % self.quote, self.quote),
+                           ("else:", None)):
+            src.append("        " + test)
+            # group states that share the same action to keep the branches short
+            actions: dict[tuple[str, ...], list[int]] = {}
+            for state, rules in self.state_transition.items():
+                if char in rules:
+                    nxt = rules[char]
+                    # quote escape in quote in quote states
+                    keep = state == QUOTE_IN_QUOTE and char == self.quote
+                else:
+                    nxt, keep = rules["OTHERS"], True
+                action = []
+                if nxt == START:
+                    # emit cell content
+                    action += ["cells.append(cell + row[seg:i])", "cell = ''", "seg = i + 1"]
+                elif not keep:
+                    # close the current run, skip the dropped char
+                    action += ["cell += row[seg:i]", "seg = i + 1"]
+                if nxt != state:
+                    action.append("state = %d" % nxt)
+                actions.setdefault(tuple(action) or ("pass",), []).append(state)
+            for i, (action, states) in enumerate(actions.items()):
+                indent = "            "
+                if len(actions) > 1:
+                    if i == len(actions) - 1:
+                        src.append(indent + "else:")
+                    else:
+                        cond = "state == %d" % states[0] if len(states) == 1 else "state in %r" % (tuple(states),)
+                        src.append(indent + ("if " if i == 0 else "elif ") + cond + ":")
+                    indent += "    "
+                src += [indent + line for line in action]
+        src += ["    cells.append(cell + row[seg:])", "    return cells"]
+
+        namespace = {}
+        exec("\n".join(src), namespace)
+        return namespace["_scan"]
 
     def _value(self, cell: str) -> str | int | float:
         try:
@@ -50,34 +116,19 @@ class CSVParser:
 
     def parse_row(self, row: str) -> list:
         """ Parse a single CSV row into fields. No newline inside cells. """
-        state = States.START
-        row_list = []
-        cell = []
-        for char in row:
-            if char in self.state_transition[state]:
-                # quote escape in quote in quote states
-                if state == States.QUOTE_IN_QUOTE and char == self.quote:
-                    cell.append(char)
-                state = self.state_transition[state][char]
-            else:
-                cell.append(char)
-                state = self.state_transition[state]["OTHERS"]
-
-            # if state is States.START, emit cell content
-            if state == States.START:
-                row_list.append(self._value(''.join(cell)))
-                cell = []
-
-        row_list.append(self._value(''.join(cell)))
-        return row_list
-
-
-    def parse(self, text: list[str]) -> list[list]:
+        # Fast path: without quotes every delimiter ends a field, so str.split
+        # scans the row in C and yields exactly what the state machine would
+        if self.quote not in row:
+            return [self._value(cell) for cell in row.split(self.delimiter)]
+
+        return [self._value(cell) for cell in self._scan(row)]
+
+    def parse(self, text: str | list[str]) -> list[list]:
         """ Parse all rows (load all into memory). """
-        res = []
-        for row in text:
-            res.append(self.parse_row(row.strip()))
-        return res
+        # A whole document is split into lines in one C-level pass
+        if isinstance(text, str):
+            text = text.splitlines()
+        return [self.parse_row(row.strip()) for row in text]
 
     def iter(self, source: Iterable[str]) -> Iterator[list]:
         """ Streaming: yield one parsed row at a time, O(1) memory. """
@@ -90,36 +141,60 @@ class CSVParser:
 
 
 class WindowAggregator:
+    __slots__ = ('window_size', 'ts_index', 'val_index',
+                 '_count', '_sum', '_max', '_min', '_window_start', '_window_end')
+
     def __init__(self, window_size: float, ts_index: int, val_index: int) -> None:
         self.window_size = window_size
         self.ts_index = ts_index
         self.val_index = val_index
-        self.aggregate_result = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        # running aggregates of the current window, O(1) to update per row
+        self._count = 0
+        self._sum = 0
+        self._max = float('-inf')
+        self._min = float('inf')
+        self._window_start = 0
+        self._window_end = float('inf')
 
     def _aggregate(self, row: list) -> None:
         ts, val = row[self.ts_index], row[self.val_index]
-        self.aggregate_result["count"] = self.aggregate_result.get("count", 0) + 1
-        self.aggregate_result["sum"] = self.aggregate_result.get("sum", 0) + val
-        self.aggregate_result["avg"] = self.aggregate_result["sum"] / self.aggregate_result["count"]
-        self.aggregate_result["max"] = max(self.aggregate_result.get("max", float('-inf')), val)
-        self.aggregate_result["min"] = min(self.aggregate_result.get("min", float('inf')), val)
-        self.aggregate_result["window_start"] = ts // self.window_size * self.window_size
-        self.aggregate_result["window_end"] = self.aggregate_result["window_start"] + self.window_size
-    
+        if self._count == 0:
+            self._window_start = ts // self.window_size * self.window_size
+            self._window_end = self._window_start + self.window_size
+        self._count += 1
+        self._sum += val
+        if val > self._max:
+            self._max = val
+        if val < self._min:
+            self._min = val
+
     def add_row(self, row: list) -> dict | None:
         """ returns result when window completes """
         completed = None
-        if row[self.ts_index] >= self.aggregate_result.get("window_end", float('inf')):
+        if row[self.ts_index] >= self._window_end:
             completed = self.flush()
-        
+
         self._aggregate(row)
 
         return completed
 
     def flush(self) -> dict | None:
-        res = self.aggregate_result.copy()
-        self.aggregate_result = {}
-        return res if res != {} else None
+        if self._count == 0:
+            return None
+        res = {
+            "count": self._count,
+            "sum": self._sum,
+            "avg": self._sum / self._count,
+            "max": self._max,
+            "min": self._min,
+            "window_start": self._window_start,
+            "window_end": self._window_end,
+        }
+        self._reset()
+        return res
 
 parser = CSVParser()
 agg = WindowAggregator(window_size=10, ts_index=3, val_index=2)
@@ -90,6 +90,18 @@ class TestLevel1:
         parser = CSVParser(quote="'")
         assert parser.parse_row("'hello, world',b") == ["hello, world", "b"]
 
+    def test_custom_quotechar_escaped(self):
+        parser = CSVParser(delimiter=";", quote="'")
+        assert parser.parse_row("'it''s';b") == ["it's", "b"]
+
+    def test_non_ascii_field(self):
+        parser = CSVParser()
+        assert parser.parse_row('café,"naïve, résumé"') == ["café", "naïve, résumé"]
+
+    def test_non_ascii_delimiter(self):
+        parser = CSVParser(delimiter="§")
+        assert parser.parse_row('a§"b§c"§1') == ["a", "b§c", 1]
+
 
 # ============================================================
 # Level 2: Streaming Iterator
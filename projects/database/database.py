@@ -1,57 +1,118 @@
+import heapq
 import json
 import time
+from bisect import bisect_left
+from itertools import islice, takewhile
 
 class Database:
+    __slots__ = ('_data', '_keys', '_added', '_removed', '_expire', '_expire_heap')
+
     def __init__(self):
         self._data = {}
+        # sorted snapshot of the keys of self._data plus the keys added to and
+        # removed from it since, folded in on the next scan so writes stay O(1)
+        self._keys: list[str] = []
+        self._added: set[str] = set()
+        self._removed: set[str] = set()
+        # deadlines on the monotonic clock, immune to wall-clock jumps
         self._expire = {}
+        # min-heap of (deadline, key), may hold stale entries for overwritten keys
+        self._expire_heap: list[tuple[float, str]] = []
     
     def set(self, key: str, value: str, ttl: int | None = None) -> None:
+        now = time.monotonic()
+        self._purge(now)
+
+        if key not in self._data:
+            if key in self._removed:
+                # still in the snapshot
+                self._removed.discard(key)
+            else:
+                self._added.add(key)
         self._data[key] = value
         
         if ttl is not None:
-            self._expire[key] = time.time() + ttl
+            self._expire[key] = now + ttl
+            heapq.heappush(self._expire_heap, (now + ttl, key))
+            # overwrites and deletes leave stale entries behind, rebuild from
+            # the live deadlines once they outnumber them, amortized O(1)
+            if len(self._expire_heap) > 2 * len(self._expire) + 64:
+                self._expire_heap = [(deadline, k) for k, deadline in self._expire.items()]
+                heapq.heapify(self._expire_heap)
         elif key in self._expire:
             # edge case, when reset the key without ttl, need to clean existing ttl
             del self._expire[key]
     
     def get(self, key: str) -> str | None:
-        # if expired, should return None
-        return self._data[key] if key in self._data and not self._is_expired(key) else None
+        # expired keys are purged, so a missing key returns None
+        self._purge(time.monotonic())
+        return self._data.get(key)
     
     def delete(self, key: str) -> bool:
         """return True if key existed"""
+        # Purge first so an expired key counts as missing
+        self._purge(time.monotonic())
         if key not in self._data:
             return False
 
-        del self._data[key]
-
-        # Return False on expired key
-        delete_status = True
-        if key in self._expire and self._is_expired(key):
-            delete_status = False
-        
-        # Remove the key from self._expire after expiration check
-        self._expire.pop(key, None)
-        
-        return delete_status
+        self._remove(key)
+        return True
     
     def scan(self) -> list[tuple[str, str]]:
-        return [(k, v) for k, v in sorted(self._data.items(), key=lambda x:x[0]) if not self._is_expired(k)]
+        self._purge(time.monotonic())
+        return [(k, self._data[k]) for k in self._sorted_keys()]
     
     def scan_by_prefix(self, prefix: str) -> list[tuple[str, str]]:
-        return [(k, v) for k, v in sorted(self._data.items(), key=lambda x:x[0]) if k.startswith(prefix) and not self._is_expired(k)]
+        self._purge(time.monotonic())
+        # matching keys are contiguous in the sorted index: jump to the first
+        # one and stop at the first key past the prefix range
+        sorted_keys = self._sorted_keys()
+        start = bisect_left(sorted_keys, prefix)
+        keys = takewhile(lambda k: k.startswith(prefix), islice(sorted_keys, start, None))
+        return [(k, self._data[k]) for k in keys]
     
-    def _is_expired(self, key: str) -> bool:
-        return key in self._expire and self._expire[key] < time.time()
+    def _sorted_keys(self) -> list[str]:
+        if self._added or self._removed:
+            keys = self._keys
+            if self._removed:
+                keys = [k for k in keys if k not in self._removed]
+            # two sorted runs, timsort merges them in linear time
+            keys += sorted(self._added)
+            keys.sort()
+            self._keys = keys
+            self._added.clear()
+            self._removed.clear()
+        return self._keys
+
+    def _remove(self, key: str) -> None:
+        del self._data[key]
+        if key in self._added:
+            self._added.discard(key)
+        else:
+            self._removed.add(key)
+        self._expire.pop(key, None)
+
+    def _purge(self, now: float) -> None:
+        """drop every key whose deadline has passed, earliest first"""
+        heap = self._expire_heap
+        while heap and heap[0][0] < now:
+            deadline, key = heapq.heappop(heap)
+            # skip stale entries left by an overwrite or delete of the key
+            if self._expire.get(key) == deadline:
+                self._remove(key)
     
     def save(self, filepath: str) -> None:
         """save database to file"""
+        self._purge(time.monotonic())
+
+        # Deadlines are stored as wall-clock timestamps, monotonic time is per-boot
+        offset = time.time() - time.monotonic()
+
         # Collect content
         content = {}
         for k, v in self._data.items():
             content[k]= {"v": v}
-            if k in self._expire: content[k]["e"] = self._expire[k]
+            if k in self._expire: content[k]["e"] = self._expire[k] + offset
         
         # Save to file
         with open(filepath, "w") as fp:
@@ -63,12 +124,19 @@ class Database:
         with open(filepath, "r") as fp:
             json_obj = json.load(fp)
 
+        offset = time.time() - time.monotonic()
+
         # Replace the data
         data = {}
         expire = {}
         for key, content in json_obj.items():
             data[key] = content["v"]
             if "e" in content:
-                expire[key] = content["e"]
+                expire[key] = content["e"] - offset
         
-        self._data, self._expire = data, expire
\ No newline at end of file
+        self._data, self._expire = data, expire
+        self._keys = sorted(data)
+        self._added.clear()
+        self._removed.clear()
+        self._expire_heap = [(deadline, key) for key, deadline in expire.items()]
+        heapq.heapify(self._expire_heap)
\ No newline at end of file
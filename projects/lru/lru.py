@@ -1,115 +1,78 @@
 import json
 import time
+from collections import OrderedDict
 from collections.abc import Callable
 
-class Node():
-    def __init__(self, key: int | None = None, val: int | None = None):
-        self.key, self.val = key, val
-        self.prev: Node | None = None
-        self.next: Node | None = None
-
-
 class LRUCache():
+    __slots__ = ('_cache', '_expire', '_cap', '_on_evict_cb')
+
     def __init__(self, cap: int):
-        self._cache = {}
+        # ordered from least to most recently used
+        self._cache: OrderedDict[int, int] = OrderedDict()
         self._expire = {}
-        self._head: Node = Node()
-        self._tail: Node = Node()
-        self._head.next, self._tail.prev = self._tail, self._head
         self._cap = cap
         self._on_evict_cb = None
     
     def get(self, key: int) -> int:
         if key in self._cache:
             if key in self._expire and time.time() > self._expire[key]:
-                self._evict_node(self._cache[key])
+                self._evict(key)
                 return -1
-            node = self._cache[key]
-            self._remove(node)
-            self._move_to_end(node)
+            self._cache.move_to_end(key)
 
-            return node.val
+            return self._cache[key]
         
         return -1
     
     def put(self, key: int, val: int, ttl: int | None = None) -> None:
         for k in list(self._expire):
             if time.time() > self._expire[k]:
-                self._evict_node(self._cache[k])
-        
-        if key in self._cache:
-            self._remove(self._cache[key])
+                self._evict(k)
 
         if ttl is not None:
             self._expire[key] = time.time() + ttl
         elif key in self._expire:
             del self._expire[key]
 
-        self._cache[key] = Node(key, val)
-        self._move_to_end(self._cache[key])
+        self._cache[key] = val
+        self._cache.move_to_end(key)
 
         if len(self._cache) > self._cap:
-            self._evict_node(self._head.next)
-
-    def _move_to_end(self, node: Node):
-        prev, nxt = self._tail.prev, self._tail
-        assert prev is not None
-        node.prev, node.next = prev, nxt
-        prev.next, nxt.prev = node, node
+            self._evict(next(iter(self._cache)))
 
-    def _remove(self, node: Node):
-        prev, nxt = node.prev, node.next
-        assert prev is not None and nxt is not None
-        nxt.prev, prev.next = prev, nxt
-    
     def keys(self) -> list[int]:
-        res = []
-        node = self._tail.prev
-        while node is not None and node != self._head:
-            if not (node.key in self._expire and time.time() > self._expire[node.key]):
-                res.append(node.key)
-            node = node.prev
-
-        return res
+        if not self._expire:
+            # nothing can be expired, copy the order straight from the dict
+            return list(reversed(self._cache))
+        now = time.time()
+        return [k for k in reversed(self._cache)
+                if not (k in self._expire and now > self._expire[k])]
     
     def peek(self, key: int) -> int:
         if key in self._cache:
             if key in self._expire and time.time() > self._expire[key]:
-                self._evict_node(self._cache[key])
+                self._evict(key)
                 return -1
-            return self._cache[key].val
+            return self._cache[key]
         
         return -1
 
-    def _evict_node(self, node: Node | None) -> None:
-        if node is None: return
-
+    def _evict(self, key: int) -> None:
+        val = self._cache.pop(key)
+        self._expire.pop(key, None)
         if self._on_evict_cb:
-            assert node.key is not None and node.val is not None
-            self._on_evict_cb(node.key, node.val)
-        
-        self._remove(node)
-        del self._cache[node.key]
-        if node.key in self._expire:
-            del self._expire[node.key]
+            self._on_evict_cb(key, val)
     
     def size(self) -> int:
-        size = 0
-        for key in self._cache:
-            if key in self._expire and time.time() > self._expire[key]:
-                continue
-            size += 1
-        return size
+        now = time.time()
+        expired = sum(1 for deadline in self._expire.values() if now > deadline)
+        return len(self._cache) - expired
 
     def on_evict(self, callback: Callable[[int, int], None]) -> None:
         self._on_evict_cb = callback
 
     def save(self, filepath: str) -> None:
-        json_obj = {"cache": [], "cap": self._cap}
-        node = self._head.next
-        while node is not None and node != self._tail:
-            json_obj["cache"].append((node.key, node.val))
-            node = node.next
+        json_obj = {"cache": list(self._cache.items()), "cap": self._cap}
 
         with open(filepath, "w") as fp:
             json.dump(json_obj, fp)
@@ -118,17 +81,7 @@ class LRUCache():
         with open(filepath, "r") as fp:
             json_obj = json.load(fp)
         
-        cache = {}
-        head, tail = Node(), Node()
-        root = head
-        for key, val in json_obj["cache"]:
-            node = Node(key, val)
-            cache[key] = node
-            root.next, node.prev = node, root
-            root = root.next
-
-        root.next, tail.prev = tail, root
-        
-        self._cache = cache
-        self._head, self._tail = head, tail
+        self._cache = OrderedDict(json_obj["cache"])
+        # TTLs are not persisted, drop any left over from the replaced state
+        self._expire = {}
         self._cap = json_obj["cap"]
\ No newline at end of file
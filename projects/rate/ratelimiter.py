@@ -1,124 +1,447 @@
 import math
+import threading
 import time
-from dataclasses import dataclass
-from collections import defaultdict, deque
-from collections.abc import Callable
-                                                                                                
-@dataclass                                                                                        
-class BucketState:
-    tokens: float
-    last_refill: float
+from array import array
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from contextlib import AbstractContextManager, nullcontext
 
+NS_PER_SEC = 1_000_000_000
+RATE_SHIFT = 40 # refill rate is fixed-point with this many fraction bits
+NEVER_NS = 2**63 - 1 # largest array('q') timestamp
+ROW_BITS = 32 # a register() token is (row generation << ROW_BITS) | row
+LOCK_STRIPES = 64 # power of two, a client's lock is hash(client_id) & (LOCK_STRIPES - 1)
+_NO_LOCK = nullcontext()
 
 class RateLimiter:
+    __slots__ = ('_fixed_peek', '_max_requests', '_window_seconds', '_strategy', '_bucket_capacity', '_refill_rate',
+                 '_window_ns', '_counter', '_logs', '_log_pool', '_client_ix', '_tokens',
+                 '_last_refill', '_deny_until', '_capacity_units', '_rate_scaled',
+                 '_refill_interval_ns', '_free_rows', '_max_clients', '_recent', '_callback',
+                 '_now', '_allow_impl', '_tat', '_emission_ns', '_locks', '_registry_lock',
+                 '_row_client', '_row_gen')
+
     def __init__(self, max_requests: int, window_seconds: int, strategy: str = "fixed",
-                 bucket_capacity: int | None = None, refill_rate: float | None = None):
+                 bucket_capacity: int | None = None, refill_rate: float | None = None,
+                 max_clients: int | None = None, thread_safe: bool = False):
         self._max_requests = max_requests
         self._window_seconds = window_seconds
         self._strategy = strategy
         self._bucket_capacity = bucket_capacity
         self._refill_rate = refill_rate
-        self._fixed_window: float | None = None # for fixed window
-        self._counter = defaultdict(int) # for fixed window
-        self._logs = defaultdict(deque) # for sliding window
-        self._buckets = {} # for token bucket
+        self._window_ns = round(window_seconds * NS_PER_SEC)
+        # for fixed window: client_id -> [window, count], a count from an older
+        # window is reset lazily, so rollover touches no other client
+        self._counter: dict[str, list[int]] = {}
+        # for sliding window: per-client ring buffer of the last max_requests
+        # timestamps (ns), plus its [head, count]
+        self._logs: dict[str, tuple[array, list[int]]] = {}
+        self._log_pool: list[tuple[array, list[int]]] = [] # released logs, reused on insert
+        # for token bucket: per-client state as parallel arrays (SoA), indexed
+        # through an interned client index. Tokens are fixed-point, NS_PER_SEC
+        # units per token, so refilling for elapsed ns adds elapsed * rate units.
+        # rate (tokens/s, i.e. units/ns) is kept scaled by 2**RATE_SHIFT, so rates
+        # down to 2**-RATE_SHIFT (about 1e-12/s) stay nonzero integers and a
+        # refill is a multiply and shift
+        self._client_ix: dict[str, int] = {}
+        self._tokens = array('q')
+        self._last_refill = array('q')
+        self._deny_until = array('q') # no admission possible before this ns
+        self._row_client: list[str] = [] # row -> client_id, for allow_by_token
+        self._row_gen = array('q') # bumped when a row is released, stales old tokens
+        if bucket_capacity is not None and refill_rate is not None:
+            self._capacity_units = round(bucket_capacity * NS_PER_SEC)
+            if self._capacity_units > NEVER_NS:
+                # token slots are signed 64-bit
+                raise ValueError(f"bucket_capacity must be at most {NEVER_NS // NS_PER_SEC} tokens")
+            self._rate_scaled = round(refill_rate * (1 << RATE_SHIFT))
+            if refill_rate > 0 and self._rate_scaled == 0:
+                raise ValueError(f"refill_rate must be 0 or at least {2.0 ** -RATE_SHIFT} tokens per second")
+            # ns per token, a zero rate never refills
+            self._refill_interval_ns: int | float = (
+                -(-(NS_PER_SEC << RATE_SHIFT) // self._rate_scaled) if self._rate_scaled else math.inf)
+        self._free_rows: list[int] = [] # released bucket rows, reused on insert
+        # for gcra: per-client theoretical arrival time (ns), one request is
+        # "paid for" every emission interval and the tat may run at most a
+        # window ahead of now
+        self._tat: dict[str, int] = {}
+        self._emission_ns = 0
+        if strategy == "gcra":
+            # with max_requests == 0 one interval already overruns the window,
+            # so every request is rejected
+            self._emission_ns = self._window_ns // max_requests if max_requests > 0 else self._window_ns + 1
+        # clients by last touch (oldest first), only kept when max_clients is set
+        self._max_clients = max_clients
+        self._recent: OrderedDict[str, None] | None = OrderedDict() if max_clients else None
         self._callback = None
+        self._now = time.monotonic_ns # bound once, saves the module global lookup per call
+        # With thread_safe a client's state is guarded by one of LOCK_STRIPES
+        # locks, so unrelated clients rarely contend. Shared structures (row/log
+        # allocation, pools, recency order) take the registry lock, only ever
+        # after a stripe lock. Off by default, an uncontended acquire costs
+        # about as much as a whole allow()
+        self._locks: list[threading.Lock] | None = None
+        self._registry_lock: AbstractContextManager = _NO_LOCK
+        if thread_safe:
+            self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+            self._registry_lock = threading.Lock()
+        # strategy is fixed for the limiter's lifetime, so resolve it once
+        strategies: dict[str, Callable[[], Callable[[str], bool]]] = {
+            "fixed": self._compile_allow,
+            "sliding_log": lambda: self._allow_sliding,
+            "token_bucket": lambda: self._allow_bucket,
+            "gcra": self._compile_allow,
+        }
+        if strategy not in strategies:
+            raise ValueError(f"unknown strategy: {strategy!r}")
+        self._allow_impl: Callable[[str], bool] = strategies[strategy]()
    
     def allow(self, client_id: str) -> bool:
-        if self._strategy == "fixed":
-            allowed = self._allow_fixed(client_id)
-        elif self._strategy == "sliding_log":
-            allowed = self._allow_sliding(client_id)
+        if self._locks is None:
+            if self._recent is not None:
+                self._touch(client_id, _NO_LOCK)
+            allowed = self._allow_impl(client_id)
         else:
-            allowed = self._allow_bucket(client_id)
+            lock = self._locks[hash(client_id) & (LOCK_STRIPES - 1)]
+            with lock:
+                if self._recent is not None:
+                    self._touch(client_id, lock)
+                allowed = self._allow_impl(client_id)
         
         if not allowed and self._callback:
             self._callback(client_id)
         
         return allowed
 
-    def _allow_fixed(self, client_id: str) -> bool:
-        now = time.time()
-        self._fixed_peek(now)
-        if self._counter[client_id] >= self._max_requests:
-            return False
-        
-        self._counter[client_id] += 1
-        return True
-    
+    def allow_batch(self, client_ids: Iterable[str]) -> list[bool]:
+        """allow() for each client_id in order, token bucket reads the clock once per batch"""
+        if self._strategy != "token_bucket":
+            return [self.allow(client_id) for client_id in client_ids]
+
+        now = self._now()
+        client_ix, peek, take = self._client_ix, self._bucket_peek, self._take_token
+        recent, touch, locks, callback = self._recent, self._touch, self._locks, self._callback
+        results = []
+        for client_id in client_ids:
+            if locks is None:
+                if recent is not None:
+                    touch(client_id, _NO_LOCK)
+                ix = client_ix.get(client_id)
+                allowed = take(peek(client_id, now) if ix is None else ix, now)
+            else:
+                lock = locks[hash(client_id) & (LOCK_STRIPES - 1)]
+                with lock:
+                    if recent is not None:
+                        touch(client_id, lock)
+                    ix = client_ix.get(client_id)
+                    allowed = take(peek(client_id, now) if ix is None else ix, now)
+            if not allowed and callback:
+                callback(client_id)
+            results.append(allowed)
+        return results
+
+    def register(self, client_id: str) -> int:
+        """intern client_id and return a token for allow_by_token()
+
+        the token stops working (KeyError) once the client is released or
+        evicted, its row may then belong to another client
+        """
+        if self._strategy != "token_bucket":
+            raise ValueError("register() needs strategy='token_bucket'")
+        lock = self._stripe(client_id)
+        with lock:
+            if self._recent is not None:
+                self._touch(client_id, lock)
+            ix = self._bucket_peek(client_id, self._now())
+            return self._row_gen[ix] << ROW_BITS | ix
+
+    def allow_by_token(self, token: int) -> bool:
+        """allow() for a token from register(), skips the client_id dict lookup"""
+        ix = token & ((1 << ROW_BITS) - 1)
+        # rows are never removed, so the range check holds without a lock
+        if ix >= len(self._row_gen):
+            raise KeyError("unknown token")
+        if self._locks is None:
+            self._check_token(token, ix)
+            if self._recent is not None:
+                self._touch(self._row_client[ix], _NO_LOCK)
+            allowed = self._take_token(ix, self._now())
+        else:
+            # the row may change hands before the lock is taken, the
+            # generation check under the lock catches that
+            lock = self._locks[hash(self._row_client[ix]) & (LOCK_STRIPES - 1)]
+            with lock:
+                self._check_token(token, ix)
+                if self._recent is not None:
+                    self._touch(self._row_client[ix], lock)
+                allowed = self._take_token(ix, self._now())
+
+        if not allowed and self._callback:
+            self._callback(self._row_client[ix])
+
+        return allowed
+
+    def _check_token(self, token: int, ix: int) -> None:
+        if self._row_gen[ix] != token >> ROW_BITS:
+            raise KeyError("stale token, the client was released or evicted")
+
+    def _compile_allow(self) -> Callable[[str], bool]:
+        """ Generate the fixed window or GCRA admission for this limiter.
+
+        The window, limit and emission interval become literals and the
+        client dict, its get and the clock are globals of the generated
+        function, so a call does no attribute lookups on self. For fixed
+        window the same window/count update is also generated as
+        self._fixed_peek for remaining() and retry_after().
+        """
+        if self._strategy == "fixed":
+            state = self._counter
+            # the client's [window, count], reset lazily when its window is over
+            peek = [
+                # integer floor division, no float divide or math.floor call
+                "    window = now // %d" % self._window_ns,
+                "    entry = _get(client_id)",
+                "    if entry is None:",
+                "        entry = _state[client_id] = [window, 0]",
+                "    elif entry[0] != window:",
+                "        entry[0] = window",
+                "        entry[1] = 0",
+            ]
+            src = [
+                "def _fixed_peek(client_id, now):",
+                *peek,
+                "    return entry",
+                "def _allow(client_id):",
+                "    now = _now()",
+                *peek,
+                "    if entry[1] >= %d:" % self._max_requests,
+                "        return False",
+                "    entry[1] += 1",
+                "    return True",
+            ]
+        else:
+            state = self._tat
+            src = [
+                "def _allow(client_id):",
+                "    now = _now()",
+                "    tat = _get(client_id, now)",
+                "    if tat < now:",
+                "        tat = now",
+                "    tat += %d" % self._emission_ns,
+                "    if tat - now > %d:" % self._window_ns,
+                "        return False",
+                "    _state[client_id] = tat",
+                "    return True",
+            ]
+
+        namespace = {"_now": self._now, "_get": state.get, "_state": state}
+        exec("\n".join(src), namespace)
+        if self._strategy == "fixed":
+            self._fixed_peek: Callable[[str, int], list[int]] = namespace["_fixed_peek"]
+        return namespace["_allow"]
+
     def _allow_sliding(self, client_id: str) -> bool:
-        now = time.time()
-        self._sliding_peek(client_id, now)
+        now = self._now()
+        # Full log whose oldest entry is still in the window, reject without pruning
+        log = self._logs.get(client_id)
+        if log is not None and 0 < log[1][1] == self._max_requests and log[0][log[1][0]] >= now - self._window_ns:
+            return False
 
-        if len(self._logs[client_id]) >= self._max_requests:
+        ring, cursor = self._sliding_peek(client_id, now)
+        head, count = cursor
+
+        if count >= self._max_requests:
             return False
         
-        self._logs[client_id].append(now)
+        # Overwrite the slot after the newest entry, no allocation
+        ring[(head + count) % self._max_requests] = now
+        cursor[1] = count + 1
         return True
     
     def _allow_bucket(self, client_id: str) -> bool:
-        now = time.time()
-        self._bucket_peek(client_id, now)
-        if self._buckets[client_id].tokens < 1:
+        now = self._now()
+        ix = self._client_ix.get(client_id)
+        if ix is None:
+            ix = self._bucket_peek(client_id, now)
+        return self._take_token(ix, now)
+
+    def _take_token(self, ix: int, now: int) -> bool:
+        """refill row ix and take one token from it if there is one"""
+        # Rejected earlier and the next token has not arrived yet, skip the refill
+        if now < self._deny_until[ix]:
+            return False
+
+        tokens = self._tokens[ix] + ((now - self._last_refill[ix]) * self._rate_scaled >> RATE_SHIFT)
+        if tokens > self._capacity_units:
+            tokens = self._capacity_units
+        self._last_refill[ix] = now
+        if tokens < NS_PER_SEC:
+            self._tokens[ix] = tokens
+            # ceil of the ns needed to refill the missing units
+            rate = self._rate_scaled
+            wait = -(((tokens - NS_PER_SEC) << RATE_SHIFT) // rate) if rate else NEVER_NS
+            self._deny_until[ix] = min(now + wait, NEVER_NS)
             return False
         
-        self._buckets[client_id].tokens -= 1
+        self._tokens[ix] = tokens - NS_PER_SEC
         return True
 
-    def _fixed_peek(self, now: float) -> None:
-        window = math.floor(now / self._window_seconds)
-        if window != self._fixed_window:
-            self._fixed_window = window
-            self._counter = defaultdict(int)
+    def _new_log(self) -> tuple[array, list[int]]:
+        with self._registry_lock:
+            if self._log_pool:
+                log = self._log_pool.pop()
+                log[1][0] = log[1][1] = 0
+                return log
+        # A client never has more than max_requests timestamps in its window
+        return array('q', [0]) * self._max_requests, [0, 0]
 
-    def _sliding_peek(self, client_id: str, now: float) -> None:
-        cutoff = now - self._window_seconds
-        log_queue = self._logs[client_id]
+    def _sliding_peek(self, client_id: str, now: int) -> tuple[array, list[int]]:
+        cutoff = now - self._window_ns
+        log = self._logs.get(client_id)
+        if log is None:
+            log = self._logs[client_id] = self._new_log()
+        ring, cursor = log
+        head, count = cursor
         
         # Prune expired entries
-        while len(log_queue) > 0 and log_queue[0] < cutoff:
-            log_queue.popleft()
+        size = self._max_requests
+        while count > 0 and ring[head] < cutoff:
+            # wrap with a compare instead of a modulo per step
+            head += 1
+            if head == size:
+                head = 0
+            count -= 1
+        cursor[0], cursor[1] = head, count
+        return ring, cursor
     
-    def _bucket_peek(self, client_id: str, now: float) -> None:
-        assert self._bucket_capacity is not None
-        assert self._refill_rate is not None
-        
-        if client_id not in self._buckets:
-            self._buckets[client_id] = BucketState(self._bucket_capacity, now)
-        state = self._buckets[client_id]
-        tokens, last_refill = state.tokens, state.last_refill
-        tokens += (now - last_refill) * self._refill_rate
-        self._buckets[client_id] = BucketState(min(self._bucket_capacity, tokens), now)
+    def _bucket_peek(self, client_id: str, now: int) -> int:
+        """refill the client's bucket in place and return its index"""
+        ix = self._client_ix.get(client_id)
+        if ix is None:
+            with self._registry_lock:
+                if self._free_rows:
+                    ix = self._free_rows.pop()
+                    self._tokens[ix] = self._capacity_units
+                    self._last_refill[ix] = now
+                    self._deny_until[ix] = 0
+                    self._row_client[ix] = client_id
+                else:
+                    ix = len(self._tokens)
+                    self._tokens.append(self._capacity_units)
+                    self._last_refill.append(now)
+                    self._deny_until.append(0)
+                    self._row_client.append(client_id)
+                    self._row_gen.append(0)
+                self._client_ix[client_id] = ix
+            return ix
+
+        tokens = self._tokens[ix] + ((now - self._last_refill[ix]) * self._rate_scaled >> RATE_SHIFT)
+        self._tokens[ix] = min(self._capacity_units, tokens)
+        self._last_refill[ix] = now
+        return ix
 
     def remaining(self, client_id: str) -> int:
         """How many requests left in current window/bucket"""
-        now = time.time()
+        lock = self._stripe(client_id)
+        with lock:
+            if self._recent is not None:
+                self._touch(client_id, lock)
+            return self._remaining(client_id, self._now())
+
+    def _remaining(self, client_id: str, now: int) -> int:
         if self._strategy == "fixed":
-            self._fixed_peek(now)
-            return self._max_requests - self._counter[client_id]
+            return self._max_requests - self._fixed_peek(client_id, now)[1]
         elif self._strategy == "sliding_log":
-            self._sliding_peek(client_id, now)
-            return int(self._max_requests - len(self._logs[client_id]))
+            _, (_, count) = self._sliding_peek(client_id, now)
+            return self._max_requests - count
+        elif self._strategy == "token_bucket":
+            return self._tokens[self._bucket_peek(client_id, now)] // NS_PER_SEC
         else:
-            self._bucket_peek(client_id, now)
-            return int(self._buckets[client_id].tokens)
+            tat = max(self._tat.get(client_id, now), now)
+            return (self._window_ns - (tat - now)) // self._emission_ns
 
     def retry_after(self, client_id: str) -> float | None:
         """seconds until next request allowed None if not limited"""
-        if self.remaining(client_id) > 0:
-            return None
-        now = time.time()
-        if self._strategy == "fixed":
-            assert self._fixed_window is not None
-            wait = (self._fixed_window + 1) * self._window_seconds - now
-        elif self._strategy == "sliding_log":
-            wait = self._logs[client_id][0] + self._window_seconds - now
-        else:
-            assert self._refill_rate is not None
-            state = self._buckets[client_id]
-            # Only 1 exact token needed
-            wait = state.last_refill + 1 / self._refill_rate - now
-        return wait
+        lock = self._stripe(client_id)
+        with lock:
+            if self._recent is not None:
+                self._touch(client_id, lock)
+            now = self._now()
+            if self._remaining(client_id, now) > 0:
+                return None
+            if self._strategy == "fixed":
+                window = self._counter[client_id][0]
+                wait_ns = (window + 1) * self._window_ns - now
+            elif self._strategy == "sliding_log":
+                ring, (head, _) = self._logs[client_id]
+                wait_ns = ring[head] + self._window_ns - now
+            elif self._strategy == "token_bucket":
+                ix = self._client_ix[client_id]
+                # Only 1 exact token needed
+                wait_ns = self._last_refill[ix] + self._refill_interval_ns - now
+            else:
+                # admitted again once tat + emission is back within a window of now
+                wait_ns = self._tat.get(client_id, now) + self._emission_ns - self._window_ns - now
+        return wait_ns / NS_PER_SEC
+
+    def _stripe(self, client_id: str) -> AbstractContextManager:
+        """client_id's stripe lock, or a no-op when not thread_safe"""
+        if self._locks is None:
+            return _NO_LOCK
+        return self._locks[hash(client_id) & (LOCK_STRIPES - 1)]
+
+    def _touch(self, client_id: str, held: AbstractContextManager) -> None:
+        """mark client_id most recent, evicting the oldest client past max_clients
+
+        held is the stripe lock the caller owns. Another stripe is only tried
+        without blocking, a busy client is skipped for the next oldest one, so
+        eviction never waits on (or deadlocks with) a concurrent caller
+        """
+        assert self._recent is not None and self._max_clients is not None
+        with self._registry_lock:
+            if client_id in self._recent:
+                self._recent.move_to_end(client_id)
+                return
+            self._recent[client_id] = None
+            if len(self._recent) <= self._max_clients:
+                return
+            if self._locks is None:
+                self._release(next(iter(self._recent)))
+                return
+            # oldest first, returns right after the one removal so the
+            # iteration never resumes over the mutated dict
+            for victim in self._recent:
+                if victim == client_id:
+                    return
+                lock = self._locks[hash(victim) & (LOCK_STRIPES - 1)]
+                if lock is held:
+                    self._release(victim)
+                    return
+                if lock.acquire(blocking=False):
+                    try:
+                        self._release(victim)
+                    finally:
+                        lock.release()
+                    return
+
+    def release(self, client_id: str) -> None:
+        """forget client_id's state, keeping its storage for the next new client"""
+        with self._stripe(client_id), self._registry_lock:
+            self._release(client_id)
+
+    def _release(self, client_id: str) -> None:
+        """caller holds client_id's stripe lock and the registry lock"""
+        if self._recent is not None:
+            self._recent.pop(client_id, None)
+        self._counter.pop(client_id, None)
+        self._tat.pop(client_id, None)
+        log = self._logs.pop(client_id, None)
+        if log is not None:
+            self._log_pool.append(log)
+        ix = self._client_ix.pop(client_id, None)
+        if ix is not None:
+            self._row_gen[ix] += 1
+            self._free_rows.append(ix)
 
     def on_reject(self, callback: Callable[[str], None]) -> None:
         """called with client_id when rejected"""